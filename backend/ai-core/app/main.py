@@ -1,5 +1,5 @@
 # AI Core Service - Main FastAPI Application
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
 import json
@@ -10,6 +10,8 @@ import os
 from dotenv import load_dotenv
 
 from .models.financial_analyzer import FinancialAnalyzer
+from .storage.meeting_log import MeetingLogStore, validate_meeting_id
+from .messaging.pubsub import create_pubsub
 
 load_dotenv()
 
@@ -29,8 +31,19 @@ app.add_middleware(
 )
 
 # Global state management
-active_connections: List[WebSocket] = []
+# Connections on this worker, keyed by meeting id so charts never cross meetings
+active_connections: Dict[str, List[WebSocket]] = {}
+# Most recent chart per meeting, as delivered by the pub/sub bus
+latest_charts: Dict[str, Dict] = {}
 financial_analyzer = FinancialAnalyzer()
+meeting_log = MeetingLogStore(
+    os.getenv(
+        "MEETING_LOG_DIR",
+        os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "meetings")
+    )
+)
+# Shares broadcasts between uvicorn workers; see PUBSUB_BACKEND in .env.example
+pubsub = create_pubsub()
 
 class TranscriptMessage(BaseModel):
     text: str
@@ -47,6 +60,14 @@ async def startup_event():
     """Initialize the AI Core service"""
     logger.info("AI Core service starting up...")
     await financial_analyzer.initialize()
+    await meeting_log.start()
+    await pubsub.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the pub/sub bus and flush any pending meeting log writes"""
+    await pubsub.stop()
+    await meeting_log.stop()
 
 @app.get("/health")
 async def health_check():
@@ -54,10 +75,15 @@ async def health_check():
     return {"status": "healthy", "service": "ai-core"}
 
 @app.websocket("/ws/transcript")
-async def websocket_transcript_endpoint(websocket: WebSocket):
+async def websocket_transcript_endpoint(websocket: WebSocket, meeting_id: str = "default"):
     """WebSocket endpoint for receiving live transcripts from Deepgram"""
+    try:
+        validate_meeting_id(meeting_id)
+    except ValueError:
+        await websocket.close(code=1008)
+        return
     await websocket.accept()
-    active_connections.append(websocket)
+    register_connection(meeting_id, websocket)
     
     try:
         while True:
@@ -66,23 +92,49 @@ async def websocket_transcript_endpoint(websocket: WebSocket):
             transcript_msg = TranscriptMessage.parse_raw(data)
             
             logger.info(f"Received transcript: {transcript_msg.text}")
+            meeting_log.append(meeting_id, "transcript", transcript_msg.model_dump())
             
             # Analyze the transcript for financial intents
             analysis_result = await financial_analyzer.analyze_text(transcript_msg.text)
             
             if analysis_result and analysis_result.get("requires_visualization"):
+                meeting_log.append(meeting_id, "analysis", analysis_result)
                 # Send visualization request to frontend
-                await broadcast_visualization_request(analysis_result)
+                await broadcast_visualization_request(meeting_id, analysis_result)
                 
     except WebSocketDisconnect:
-        active_connections.remove(websocket)
         logger.info("Transcript WebSocket disconnected")
+    finally:
+        unregister_connection(meeting_id, websocket)
 
 @app.websocket("/ws/advisor")
-async def websocket_advisor_endpoint(websocket: WebSocket):
+async def websocket_advisor_endpoint(websocket: WebSocket, meeting_id: str = "default"):
     """WebSocket endpoint for the advisor's frontend interface"""
+    try:
+        validate_meeting_id(meeting_id)
+    except ValueError:
+        await websocket.close(code=1008)
+        return
     await websocket.accept()
-    active_connections.append(websocket)
+    # Register first so no live chart is missed while the current one is restored
+    register_connection(meeting_id, websocket)
+    
+    # Restore the current chart for advisors rejoining a meeting in progress;
+    # the log is needed whenever this worker had no sockets in the meeting,
+    # since it only receives a meeting's charts while subscribed to its channel
+    current_chart = latest_charts.get(meeting_id)
+    if current_chart is None:
+        latest = await meeting_log.latest(meeting_id, "analysis")
+        # Skip the stored chart if a newer one was delivered while reading the log
+        if latest and meeting_id not in latest_charts:
+            current_chart = {
+                "type": "visualization_request",
+                "meeting_id": meeting_id,
+                "data": latest.data,
+                "offset": latest.offset
+            }
+    if current_chart:
+        await websocket.send_text(json.dumps(current_chart))
     
     try:
         while True:
@@ -91,26 +143,56 @@ async def websocket_advisor_endpoint(websocket: WebSocket):
             logger.info(f"Received message from advisor: {data}")
             
     except WebSocketDisconnect:
-        active_connections.remove(websocket)
         logger.info("Advisor WebSocket disconnected")
+    finally:
+        unregister_connection(meeting_id, websocket)
+
+def visualization_channel(meeting_id: str) -> str:
+    """Pub/sub channel carrying one meeting's visualization requests"""
+    return f"visualization:{meeting_id}"
 
-async def broadcast_visualization_request(analysis_result: Dict):
-    """Broadcast visualization request to all connected clients"""
-    if active_connections:
-        message = json.dumps({
-            "type": "visualization_request",
-            "data": analysis_result
-        })
+def register_connection(meeting_id: str, websocket: WebSocket):
+    connections = active_connections.setdefault(meeting_id, [])
+    if not connections:
+        # First socket for this meeting on this worker
+        pubsub.subscribe(visualization_channel(meeting_id), deliver_visualization_request)
+    connections.append(websocket)
+
+def unregister_connection(meeting_id: str, websocket: WebSocket):
+    connections = active_connections.get(meeting_id)
+    if connections is None:
+        return
+    if websocket in connections:
+        connections.remove(websocket)
+    if not connections:
+        del active_connections[meeting_id]
+        latest_charts.pop(meeting_id, None)
+        pubsub.unsubscribe(visualization_channel(meeting_id), deliver_visualization_request)
+
+async def broadcast_visualization_request(meeting_id: str, analysis_result: Dict):
+    """Broadcast visualization request to the meeting's clients on any worker"""
+    await pubsub.publish(visualization_channel(meeting_id), {
+        "type": "visualization_request",
+        "meeting_id": meeting_id,
+        "data": analysis_result
+    })
+
+async def deliver_visualization_request(payload: Dict):
+    """Send a visualization request from the pub/sub bus to this worker's clients in that meeting"""
+    meeting_id = payload.get("meeting_id")
+    connections = active_connections.get(meeting_id)
+    if connections:
+        latest_charts[meeting_id] = payload
+        message = json.dumps(payload)
         
-        # Send to all active connections
-        for connection in active_connections[:]:  # Create a copy to avoid modification during iteration
+        # Send to the meeting's connections only
+        for connection in connections[:]:  # Create a copy to avoid modification during iteration
             try:
                 await connection.send_text(message)
             except Exception as e:
                 logger.error(f"Error sending message to connection: {e}")
                 # Remove failed connections
-                if connection in active_connections:
-                    active_connections.remove(connection)
+                unregister_connection(meeting_id, connection)
 
 @app.post("/analyze")
 async def analyze_text(message: TranscriptMessage):
@@ -118,6 +200,26 @@ async def analyze_text(message: TranscriptMessage):
     analysis_result = await financial_analyzer.analyze_text(message.text)
     return analysis_result
 
+@app.get("/meetings/{meeting_id}/log")
+async def replay_meeting_log(
+    meeting_id: str,
+    offset: int = 0,
+    since: Optional[float] = None,
+    limit: int = 100,
+    kind: Optional[str] = None
+):
+    """Replay stored transcripts and analysis results for a meeting"""
+    try:
+        records = await meeting_log.replay(meeting_id, offset=offset, since=since, limit=min(limit, 1000), kind=kind)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "meeting_id": meeting_id,
+        "records": [record.to_dict() for record in records],
+        "next_offset": records[-1].offset + 1 if records else offset
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
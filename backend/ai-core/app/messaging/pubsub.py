@@ -0,0 +1,419 @@
+# Pub/Sub - Pluggable message bus for sharing broadcasts across ai-core workers
+import abc
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import stat
+import subprocess
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict], Awaitable[None]]
+
+# backend/ai-core, so a spawned broker can run `python -m app.messaging.pubsub`
+AI_CORE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def private_dir(path: str) -> str:
+    """Create `path` (mode 0700) if needed; refuse a directory another user controls"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.geteuid():
+        raise PermissionError(f"{path} is not a directory owned by uid {os.geteuid()}")
+    if st.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return path
+
+def default_socket_path() -> str:
+    """Broker socket in a per-user directory, never a shared one like /tmp"""
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        directory = os.path.join(runtime_dir, "insightai")
+    else:
+        directory = os.path.join(AI_CORE_DIR, "data", "run")
+    return os.path.join(private_dir(directory), "pubsub.sock")
+
+class PubSub(abc.ABC):
+    """
+    Base class for message buses. Every subscriber, including the publishing
+    process itself, receives each published message exactly once.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = {}
+
+    def subscribe(self, channel: str, handler: Handler):
+        handlers = self._handlers.setdefault(channel, [])
+        handlers.append(handler)
+        if len(handlers) == 1:
+            self._channel_opened(channel)
+
+    def unsubscribe(self, channel: str, handler: Handler):
+        handlers = self._handlers.get(channel)
+        if not handlers or handler not in handlers:
+            return
+        handlers.remove(handler)
+        if not handlers:
+            del self._handlers[channel]
+            self._channel_closed(channel)
+
+    def _channel_opened(self, channel: str):
+        """Called when `channel` gets its first handler"""
+
+    def _channel_closed(self, channel: str):
+        """Called when the last handler of `channel` is removed"""
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abc.abstractmethod
+    async def publish(self, channel: str, message: Dict):
+        """Deliver `message` to every subscriber of `channel`"""
+
+    async def _dispatch(self, channel: str, message: Dict):
+        # Copied because a handler may unsubscribe while we iterate
+        for handler in list(self._handlers.get(channel, ())):
+            try:
+                await handler(message)
+            except Exception as e:
+                logger.error(f"Error in pub/sub handler for {channel}: {e}")
+
+class InProcessPubSub(PubSub):
+    """Delivers messages to handlers in this process only (single worker)"""
+
+    async def publish(self, channel: str, message: Dict):
+        await self._dispatch(channel, message)
+
+def acquire_broker_lock(socket_path: str) -> Optional[int]:
+    """Take the lock that elects the broker for `socket_path`; None if already held"""
+    fd = os.open(socket_path + ".lock", os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+class UnixSocketBroker:
+    """
+    Minimal fan-out broker speaking newline-delimited JSON over a Unix socket.
+    Clients send {"op": "subscribe", "channel": ...},
+    {"op": "unsubscribe", "channel": ...} and
+    {"op": "publish", "channel": ..., "data": ...}; the broker relays each
+    publish as {"channel": ..., "data": ...} to every subscriber of the channel.
+    {"op": "sync"} is answered with {"op": "synced"} once everything the
+    client sent before it has been applied.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        max_buffer: int = 4 * 1024 * 1024,
+        idle_timeout: Optional[float] = None
+    ):
+        self.socket_path = socket_path
+        self.max_buffer = max_buffer
+        self.idle_timeout = idle_timeout
+        self._subscribers: Dict[str, Set[asyncio.StreamWriter]] = {}
+        self._clients: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            # Left behind by a broker that exited; the caller holds the broker lock
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(
+            self._handle_client, path=self.socket_path, limit=self.max_buffer
+        )
+        # Only workers running as the same user may connect
+        os.chmod(self.socket_path, 0o600)
+        logger.info(f"Pub/sub broker listening on {self.socket_path}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        # Closing a client makes its handler see EOF and return on its own
+        clients = dict(self._clients)
+        for writer in clients.values():
+            writer.close()
+        await asyncio.gather(*clients, return_exceptions=True)
+        self._subscribers.clear()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    async def serve_forever(self):
+        """Serve until no client has been connected for `idle_timeout` seconds"""
+        await self.start()
+        idle_since = time.monotonic()
+        try:
+            while True:
+                await asyncio.sleep(min(self.idle_timeout or 1.0, 1.0))
+                if self._clients:
+                    idle_since = time.monotonic()
+                elif self.idle_timeout and time.monotonic() - idle_since >= self.idle_timeout:
+                    logger.info("Pub/sub broker idle; exiting")
+                    break
+        finally:
+            await self.stop()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._clients[task] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    self._handle_frame(json.loads(line), writer)
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    # One bad frame should not cost the client its connection
+                    logger.warning(f"Skipping malformed pub/sub frame: {e!r}")
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError) as e:
+            logger.warning(f"Dropping pub/sub client: {e}")
+        finally:
+            for channel in list(self._subscribers):
+                self._remove_subscriber(channel, writer)
+            self._clients.pop(task, None)
+            writer.close()
+
+    def _handle_frame(self, frame: Dict, writer: asyncio.StreamWriter):
+        op = frame.get("op")
+        if op == "subscribe":
+            self._subscribers.setdefault(frame["channel"], set()).add(writer)
+        elif op == "unsubscribe":
+            self._remove_subscriber(frame["channel"], writer)
+        elif op == "publish":
+            self._relay(frame["channel"], frame.get("data"))
+        elif op == "sync":
+            writer.write(b'{"op":"synced"}\n')
+        else:
+            raise ValueError(f"Unknown op {op!r}")
+
+    def _remove_subscriber(self, channel: str, writer: asyncio.StreamWriter):
+        writers = self._subscribers.get(channel)
+        if writers is None:
+            return
+        writers.discard(writer)
+        if not writers:
+            # Channels are per meeting, so never keep empty ones around
+            del self._subscribers[channel]
+
+    def _relay(self, channel: str, data):
+        line = json.dumps({"channel": channel, "data": data}, separators=(",", ":")).encode("utf-8") + b"\n"
+        for writer in list(self._subscribers.get(channel, ())):
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                # Never let one stalled worker hold up the others
+                logger.warning("Disconnecting slow pub/sub subscriber")
+                self._remove_subscriber(channel, writer)
+                writer.close()
+                continue
+            writer.write(line)
+
+class UnixSocketPubSub(PubSub):
+    """
+    Shares messages between worker processes on one host through a
+    UnixSocketBroker running in its own process, so relaying never competes
+    with a worker's WebSocket traffic. When no broker is reachable a worker
+    spawns one; the broker lock keeps a single broker alive, and a broker
+    exits once no worker has been connected for `broker_idle_timeout`.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        reconnect_interval: float = 0.2,
+        broker_idle_timeout: float = 30.0,
+        max_frame: int = 4 * 1024 * 1024
+    ):
+        super().__init__()
+        self.socket_path = socket_path
+        self.max_frame = max_frame
+        self.reconnect_interval = reconnect_interval
+        self.broker_idle_timeout = broker_idle_timeout
+        self._broker_process: Optional[subprocess.Popen] = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connected = False
+
+    async def start(self):
+        await self._connect()
+        self._reader_task = asyncio.create_task(self._reader_loop())
+
+    async def stop(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._connected = False
+
+    async def publish(self, channel: str, message: Dict):
+        if self._connected:
+            frame = {"op": "publish", "channel": channel, "data": message}
+            try:
+                self._send_frame(frame)
+                await self._writer.drain()
+                return
+            except ConnectionError as e:
+                # The reader loop notices the lost broker and reconnects
+                logger.warning(f"Pub/sub broker connection lost while publishing: {e}")
+                self._connected = False
+        # Without a broker, at least this worker's own subscribers get the message
+        logger.warning(f"Pub/sub broker unavailable; delivering {channel} locally only")
+        await self._dispatch(channel, message)
+
+    def _channel_opened(self, channel: str):
+        # While disconnected, _subscribe_all covers the channel on reconnect
+        if self._connected:
+            self._send_frame({"op": "subscribe", "channel": channel})
+
+    def _channel_closed(self, channel: str):
+        if self._connected:
+            self._send_frame({"op": "unsubscribe", "channel": channel})
+
+    def _send_frame(self, frame: Dict):
+        # Control frames are tiny, so they are buffered without waiting on drain()
+        self._writer.write(json.dumps(frame, separators=(",", ":")).encode("utf-8") + b"\n")
+
+    def _spawn_broker(self):
+        """Start a broker process unless one already holds the broker lock"""
+        if self._broker_process is not None and self._broker_process.poll() is None:
+            return
+        fd = acquire_broker_lock(self.socket_path)
+        if fd is None:
+            return
+        # Release the probe; the spawned broker takes the lock for itself
+        os.close(fd)
+        env = dict(os.environ, PUBSUB_SOCKET=self.socket_path, PUBSUB_BROKER_IDLE_TIMEOUT=str(self.broker_idle_timeout))
+        self._broker_process = subprocess.Popen(
+            [sys.executable, "-m", "app.messaging.pubsub"],
+            cwd=AI_CORE_DIR, env=env, stdin=subprocess.DEVNULL
+        )
+
+    async def _connect(self):
+        while True:
+            try:
+                self._check_socket_owner()
+                reader, writer = await asyncio.open_unix_connection(self.socket_path, limit=self.max_frame)
+                channels = await self._subscribe_all(reader, writer)
+                break
+            except (FileNotFoundError, ConnectionError, ValueError):
+                self._spawn_broker()
+                await asyncio.sleep(self.reconnect_interval)
+
+        self._reader = reader
+        self._writer = writer
+        self._connected = True
+        # Catch up on channels (un)subscribed while the handshake was in flight
+        for channel in channels - self._handlers.keys():
+            self._channel_closed(channel)
+        for channel in self._handlers.keys() - channels:
+            self._channel_opened(channel)
+
+    def _check_socket_owner(self):
+        # A socket created by another user could impersonate the broker
+        owner = os.stat(self.socket_path).st_uid
+        if owner != os.geteuid():
+            raise PermissionError(f"Refusing pub/sub socket {self.socket_path} owned by uid {owner}")
+
+    async def _subscribe_all(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Set[str]:
+        """Subscribe a new connection to every channel; returns the channels sent"""
+        channels = set(self._handlers)
+        for channel in channels:
+            frame = {"op": "subscribe", "channel": channel}
+            writer.write(json.dumps(frame).encode("utf-8") + b"\n")
+        # Wait until the broker has registered our subscriptions before publishing
+        writer.write(b'{"op":"sync"}\n')
+        await writer.drain()
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                writer.close()
+                raise
+            if not line:
+                writer.close()
+                raise ConnectionError("Pub/sub broker closed the connection")
+            frame = self._parse_frame(line)
+            if frame is None:
+                continue
+            if frame.get("op") == "synced":
+                return channels
+            await self._dispatch(frame["channel"], frame["data"])
+
+    def _parse_frame(self, line: bytes) -> Optional[Dict]:
+        """Decode a frame from the broker; None (and a log line) if it is malformed"""
+        try:
+            frame = json.loads(line)
+            if frame.get("op") == "synced" or ("channel" in frame and "data" in frame):
+                return frame
+            error = "missing channel or data"
+        except (ValueError, AttributeError) as e:
+            error = repr(e)
+        logger.error(f"Skipping malformed pub/sub frame: {error}")
+        return None
+
+    async def _reader_loop(self):
+        while True:
+            try:
+                line = await self._reader.readline()
+            except ConnectionError:
+                line = b""
+            except ValueError as e:
+                # An oversized frame leaves the stream mid-line; start over on a new connection
+                logger.error(f"Oversized pub/sub frame: {e}")
+                line = b""
+            if not line:
+                logger.warning("Lost connection to pub/sub broker; reconnecting")
+                self._connected = False
+                self._writer.close()
+                try:
+                    await self._connect()
+                except PermissionError as e:
+                    logger.error(f"{e}; delivering messages locally only")
+                    return
+                continue
+            frame = self._parse_frame(line)
+            if frame is not None:
+                await self._dispatch(frame["channel"], frame["data"])
+
+def create_pubsub(backend: Optional[str] = None, socket_path: Optional[str] = None) -> PubSub:
+    """Build the pub/sub backend selected by PUBSUB_BACKEND ("memory" or "unix")"""
+    backend = backend or os.getenv("PUBSUB_BACKEND", "memory")
+    if backend == "memory":
+        return InProcessPubSub()
+    if backend == "unix":
+        return UnixSocketPubSub(
+            socket_path or os.getenv("PUBSUB_SOCKET") or default_socket_path(),
+            broker_idle_timeout=float(os.getenv("PUBSUB_BROKER_IDLE_TIMEOUT", "30"))
+        )
+    raise ValueError(f"Unknown pub/sub backend: {backend}")
+
+if __name__ == "__main__":
+    # Spawned by workers on demand, or run by hand to keep a broker up permanently
+    logging.basicConfig(level=logging.INFO)
+    socket_path = os.getenv("PUBSUB_SOCKET") or default_socket_path()
+    idle_timeout = float(os.getenv("PUBSUB_BROKER_IDLE_TIMEOUT", "0")) or None
+    lock_fd = acquire_broker_lock(socket_path)
+    if lock_fd is None:
+        raise SystemExit(0)
+    # Record who holds the lock so operators can find the broker process
+    os.ftruncate(lock_fd, 0)
+    os.write(lock_fd, str(os.getpid()).encode("ascii"))
+    asyncio.run(UnixSocketBroker(socket_path, idle_timeout=idle_timeout).serve_forever())
@@ -0,0 +1,513 @@
+# Meeting Log - Append-only, segmented storage for transcripts and analysis results
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Record header: payload length, crc32 of payload, append timestamp, record kind
+RECORD_HEADER = struct.Struct("<IIdB")
+# Index entry: append timestamp, byte position in the segment, record kind
+INDEX_ENTRY = struct.Struct("<dIB")
+
+RECORD_KINDS = {"transcript": 1, "analysis": 2}
+KIND_NAMES = {code: name for name, code in RECORD_KINDS.items()}
+
+MEETING_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+def validate_meeting_id(meeting_id: str) -> str:
+    """Reject meeting ids that are not safe to use as a directory name"""
+    # fullmatch, since `$` would also accept a trailing newline
+    if not isinstance(meeting_id, str) or not MEETING_ID_PATTERN.fullmatch(meeting_id):
+        raise ValueError(f"Invalid meeting id: {meeting_id!r}")
+    return meeting_id
+
+@dataclass
+class LogRecord:
+    offset: int
+    timestamp: float
+    kind: str
+    data: Dict[str, Any]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+class Segment:
+    """
+    A single log segment: a `.log` file of framed records plus a `.index`
+    file with one fixed-size entry per record. Offsets inside a segment are
+    implicit (base_offset + position in the index).
+    """
+
+    def __init__(self, directory: str, base_offset: int):
+        self.base_offset = base_offset
+        self.log_path = os.path.join(directory, f"{base_offset:020d}.log")
+        self.index_path = os.path.join(directory, f"{base_offset:020d}.index")
+        self.timestamps: List[float] = []
+        self.positions: List[int] = []
+        self.kinds: List[int] = []
+        self.size = 0
+        self._log_file = None
+        self._index_file = None
+
+    @property
+    def next_offset(self) -> int:
+        return self.base_offset + len(self.positions)
+
+    def load(self):
+        """Load the index and recover any records written after the last index entry"""
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                raw = f.read()
+            usable = len(raw) - len(raw) % INDEX_ENTRY.size
+            for timestamp, position, kind in INDEX_ENTRY.iter_unpack(raw[:usable]):
+                self.timestamps.append(timestamp)
+                self.positions.append(position)
+                self.kinds.append(kind)
+
+        log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        position = 0
+        dropped = False
+        # The index is not fsynced in step with the log, so any number of
+        # trailing entries may point past the durable end of the log
+        while self.positions:
+            last = self._read_header(self.positions[-1])
+            if last is not None:
+                position = self.positions[-1] + RECORD_HEADER.size + last[0]
+                break
+            self._pop_index_entry()
+            dropped = True
+
+        # Re-index records that made it into the log but not into the index
+        recovered: List[Tuple[float, int, int]] = []
+        while position < log_size:
+            header = self._read_header(position)
+            if header is None:
+                break
+            length, _crc, timestamp, kind = header
+            recovered.append((timestamp, position, kind))
+            position += RECORD_HEADER.size + length
+
+        if position < log_size:
+            logger.warning(f"Truncating torn tail of {self.log_path} at byte {position}")
+            with open(self.log_path, "r+b") as f:
+                f.truncate(position)
+
+        self.size = position
+        self._rewrite_index_if_needed(recovered, force=dropped)
+
+    def refresh(self, repair: bool = False):
+        """Pick up index entries appended by another worker process"""
+        raw = b""
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                f.seek(len(self.positions) * INDEX_ENTRY.size)
+                raw = f.read()
+        usable = len(raw) - len(raw) % INDEX_ENTRY.size
+        for timestamp, position, kind in INDEX_ENTRY.iter_unpack(raw[:usable]):
+            self.timestamps.append(timestamp)
+            self.positions.append(position)
+            self.kinds.append(kind)
+        if repair and usable < len(raw):
+            # A writer died mid-entry; drop the partial entry before appending after it
+            with open(self.index_path, "r+b") as f:
+                f.truncate(len(self.positions) * INDEX_ENTRY.size)
+        self.size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+
+    def _pop_index_entry(self):
+        self.timestamps.pop()
+        self.positions.pop()
+        self.kinds.pop()
+
+    def _rewrite_index_if_needed(self, recovered: List[Tuple[float, int, int]], force: bool = False):
+        on_disk = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        for timestamp, position, kind in recovered:
+            self.timestamps.append(timestamp)
+            self.positions.append(position)
+            self.kinds.append(kind)
+
+        if force or on_disk != len(self.positions) * INDEX_ENTRY.size:
+            with open(self.index_path, "wb") as f:
+                for entry in zip(self.timestamps, self.positions, self.kinds):
+                    f.write(INDEX_ENTRY.pack(*entry))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _read_header(self, position: int) -> Optional[Tuple[int, int, float, int]]:
+        """Read and verify the record at `position`; None if it is missing or torn"""
+        try:
+            with open(self.log_path, "rb") as f:
+                f.seek(position)
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return None
+                length, crc, timestamp, kind = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+        except FileNotFoundError:
+            return None
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return None
+        return length, crc, timestamp, kind
+
+    def open_for_append(self):
+        if self._log_file is None:
+            self._log_file = open(self.log_path, "ab")
+            self._index_file = open(self.index_path, "ab")
+
+    def append(self, timestamp: float, kind: int, payload: bytes):
+        self.open_for_append()
+        position = self.size
+        self._log_file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload), timestamp, kind))
+        self._log_file.write(payload)
+        self._index_file.write(INDEX_ENTRY.pack(timestamp, position, kind))
+        self.size += RECORD_HEADER.size + len(payload)
+        self.timestamps.append(timestamp)
+        self.positions.append(position)
+        self.kinds.append(kind)
+
+    def flush(self, fsync: bool):
+        if self._log_file is None:
+            return
+        self._log_file.flush()
+        self._index_file.flush()
+        if fsync:
+            # Log data must be durable before the index entries pointing at it
+            os.fsync(self._log_file.fileno())
+            os.fsync(self._index_file.fileno())
+
+    def close(self, fsync: bool = True):
+        if self._log_file is not None:
+            self.flush(fsync)
+            self._log_file.close()
+            self._index_file.close()
+            self._log_file = None
+            self._index_file = None
+
+    def read(self, start: int, end: int) -> List[LogRecord]:
+        """Read records with segment-relative indexes in [start, end)"""
+        if start >= end:
+            return []
+        records = []
+        with open(self.log_path, "rb") as f:
+            f.seek(self.positions[start])
+            for i in range(start, end):
+                length, _crc, timestamp, kind = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                payload = f.read(length)
+                records.append(self._record(i, timestamp, kind, payload))
+        return records
+
+    def read_indexes(self, indexes: List[int]) -> List[LogRecord]:
+        """Read records at scattered segment-relative indexes with one open file"""
+        records = []
+        with open(self.log_path, "rb") as f:
+            for i in indexes:
+                f.seek(self.positions[i])
+                length, _crc, timestamp, kind = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                records.append(self._record(i, timestamp, kind, f.read(length)))
+        return records
+
+    def _record(self, index: int, timestamp: float, kind: int, payload: bytes) -> LogRecord:
+        return LogRecord(
+            offset=self.base_offset + index,
+            timestamp=timestamp,
+            kind=KIND_NAMES.get(kind, "unknown"),
+            data=json.loads(payload)
+        )
+
+class MeetingLog:
+    """
+    Append-only log for a single meeting, split into size-bounded segments.
+    All methods are blocking and are meant to run on the store's executor.
+    Several worker processes may share a meeting directory: writers hold an
+    exclusive lock on it and readers a shared one, and both pick up segments
+    and records written by other processes before acting.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segments: List[Segment] = []
+        self.last_timestamp = 0.0
+        self.committed_offset = 0
+        self._lock = threading.Lock()
+
+    @property
+    def next_offset(self) -> int:
+        return self.segments[-1].next_offset if self.segments else 0
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, self._file_lock(exclusive=True):
+            for base_offset in self._segment_offsets():
+                segment = Segment(self.directory, base_offset)
+                segment.load()
+                self.segments.append(segment)
+            self._update_committed()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        with open(os.path.join(self.directory, ".lock"), "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _segment_offsets(self) -> List[int]:
+        return sorted(
+            int(name[:-4]) for name in os.listdir(self.directory)
+            if name.endswith(".log") and name[:-4].isdigit()
+        )
+
+    def _update_committed(self):
+        if self.segments and self.segments[-1].timestamps:
+            self.last_timestamp = max(self.last_timestamp, self.segments[-1].timestamps[-1])
+        self.committed_offset = self.next_offset
+
+    def _refresh(self, repair: bool = False):
+        """Catch up with records and segments written by other processes"""
+        known = self.segments[-1].base_offset if self.segments else -1
+        new_offsets = [base for base in self._segment_offsets() if base > known]
+        if self.segments:
+            self.segments[-1].refresh(repair)
+            if new_offsets:
+                self.segments[-1].close()
+        for base_offset in new_offsets:
+            segment = Segment(self.directory, base_offset)
+            segment.refresh(repair)
+            self.segments.append(segment)
+        self._update_committed()
+
+    def append_batch(self, entries: List[Tuple[str, Dict[str, Any]]], fsync: bool):
+        touched = []
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh(repair=True)
+            for kind, data in entries:
+                segment = self._active_segment()
+                if segment not in touched:
+                    touched.append(segment)
+                # Keep timestamps monotonic so the timestamp index stays sorted
+                self.last_timestamp = max(self.last_timestamp, time.time())
+                payload = json.dumps(data, separators=(",", ":")).encode("utf-8")
+                segment.append(self.last_timestamp, RECORD_KINDS[kind], payload)
+
+            # Close after every batch so idle meetings hold no file descriptors
+            for segment in touched:
+                segment.flush(fsync)
+                segment.close(fsync=False)
+            self._update_committed()
+
+    def _active_segment(self) -> Segment:
+        if not self.segments or self.segments[-1].size >= self.segment_bytes:
+            segment = Segment(self.directory, self.next_offset)
+            self.segments.append(segment)
+        return self.segments[-1]
+
+    def offset_for_timestamp(self, since: float) -> int:
+        """First offset whose append timestamp is >= `since`"""
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            for segment in self.segments:
+                if segment.timestamps and segment.timestamps[-1] >= since:
+                    return segment.base_offset + bisect_left(segment.timestamps, since)
+            return self.committed_offset
+
+    def read(self, offset: int, limit: int, kind: Optional[str] = None) -> List[LogRecord]:
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            committed = self.committed_offset
+            bases = [segment.base_offset for segment in self.segments]
+            segments = list(self.segments)
+        if kind is not None and kind not in RECORD_KINDS:
+            raise ValueError(f"Unknown record kind: {kind}")
+        wanted = RECORD_KINDS[kind] if kind else None
+
+        records: List[LogRecord] = []
+        index = max(bisect_right(bases, offset) - 1, 0)
+        while index < len(segments) and offset < committed and len(records) < limit:
+            segment = segments[index]
+            end = min(segment.next_offset, committed) - segment.base_offset
+            start = max(offset - segment.base_offset, 0)
+            if wanted is None:
+                stop = min(end, start + limit - len(records))
+                records.extend(segment.read(start, stop))
+            else:
+                # Filter on the in-memory index so only matching records are read
+                matches = [i for i in range(start, end) if segment.kinds[i] == wanted]
+                records.extend(segment.read_indexes(matches[:limit - len(records)]))
+            offset = segment.next_offset
+            index += 1
+        return records
+
+    def latest(self, kind: str) -> Optional[LogRecord]:
+        """Most recent committed record of the given kind, found via the index"""
+        wanted = RECORD_KINDS[kind]
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            committed = self.committed_offset
+            for segment in reversed(self.segments):
+                end = min(segment.next_offset, committed) - segment.base_offset
+                for i in range(end - 1, -1, -1):
+                    if segment.kinds[i] == wanted:
+                        return segment.read(i, i + 1)[0]
+        return None
+
+    def close(self):
+        with self._lock, self._file_lock(exclusive=False):
+            self._refresh()
+            for segment in self.segments:
+                segment.close()
+
+class MeetingLogStore:
+    """
+    Per-meeting append-only logs. Appends are queued from the event loop and
+    written by a background task in batches, with one fsync per batch.
+    At most `max_cached_logs` meetings keep their index in memory, and at most
+    `max_pending` records wait for the writer; further appends are dropped.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        segment_bytes: int = 8 * 1024 * 1024,
+        flush_interval: float = 0.05,
+        max_batch: int = 512,
+        max_cached_logs: int = 256,
+        max_pending: int = 10000
+    ):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_cached_logs = max_cached_logs
+        self.max_pending = max_pending
+        self._logs: "OrderedDict[str, MeetingLog]" = OrderedDict()
+        self._logs_lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        # A single writer thread keeps disk I/O off the event loop and ordered
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="meeting-log")
+
+    async def start(self):
+        os.makedirs(self.root, exist_ok=True)
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._writer_task = asyncio.create_task(self._writer_loop())
+        logger.info(f"Meeting log store writing to {self.root}")
+
+    async def stop(self):
+        """Drain pending appends, fsync and close every open segment"""
+        if self._writer_task is None:
+            return
+        await self._queue.put(None)
+        await self._writer_task
+        self._writer_task = None
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._close_all)
+
+    def append(self, meeting_id: str, kind: str, data: Dict[str, Any]):
+        """Queue a record for writing; never blocks the caller"""
+        if kind not in RECORD_KINDS:
+            raise ValueError(f"Unknown record kind: {kind}")
+        if self._queue is None:
+            logger.warning("Meeting log store not started; dropping record")
+            return
+        try:
+            self._queue.put_nowait((validate_meeting_id(meeting_id), kind, data))
+        except asyncio.QueueFull:
+            # Never let a slow disk grow memory without bound
+            logger.error(f"Meeting log writer is behind; dropping {kind} record for {meeting_id}")
+
+    async def replay(
+        self,
+        meeting_id: str,
+        offset: int = 0,
+        since: Optional[float] = None,
+        limit: int = 100,
+        kind: Optional[str] = None
+    ) -> List[LogRecord]:
+        """Read committed records from `offset`, or from the first record at or after `since`"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._replay, meeting_id, offset, since, limit, kind)
+
+    async def latest(self, meeting_id: str, kind: str = "analysis") -> Optional[LogRecord]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._latest, meeting_id, kind)
+
+    def _replay(self, meeting_id, offset, since, limit, kind) -> List[LogRecord]:
+        log = self._get_log(meeting_id, create=False)
+        if log is None:
+            return []
+        if since is not None:
+            offset = max(offset, log.offset_for_timestamp(since))
+        return log.read(offset, limit, kind)
+
+    def _latest(self, meeting_id: str, kind: str) -> Optional[LogRecord]:
+        log = self._get_log(meeting_id, create=False)
+        return log.latest(kind) if log else None
+
+    def _get_log(self, meeting_id: str, create: bool) -> Optional[MeetingLog]:
+        validate_meeting_id(meeting_id)
+        with self._logs_lock:
+            log = self._logs.get(meeting_id)
+            if log is None:
+                directory = os.path.join(self.root, meeting_id)
+                if not create and not os.path.isdir(directory):
+                    return None
+                log = MeetingLog(directory, self.segment_bytes)
+                log.open()
+                self._logs[meeting_id] = log
+                # Segment files are closed after every batch, so evicting only
+                # drops the cached index; a later access reloads it from disk
+                while len(self._logs) > self.max_cached_logs:
+                    self._logs.popitem(last=False)
+            else:
+                self._logs.move_to_end(meeting_id)
+            return log
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            # Let more records accumulate so one fsync covers the whole batch
+            if item is not None:
+                await asyncio.sleep(self.flush_interval)
+            batch = [item]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            if None in batch:
+                stopping = True
+            grouped: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+            for entry in batch:
+                if entry is not None:
+                    meeting_id, kind, data = entry
+                    grouped.setdefault(meeting_id, []).append((kind, data))
+            if not grouped:
+                continue
+            try:
+                await loop.run_in_executor(self._executor, self._write_batch, grouped)
+            except Exception as e:
+                logger.error(f"Error writing meeting log batch: {e}")
+
+    def _write_batch(self, grouped: Dict[str, List[Tuple[str, Dict[str, Any]]]]):
+        for meeting_id, entries in grouped.items():
+            self._get_log(meeting_id, create=True).append_batch(entries, fsync=True)
+
+    def _close_all(self):
+        with self._logs_lock:
+            for log in self._logs.values():
+                log.close()
@@ -0,0 +1,156 @@
+# Pub/Sub Scaling Benchmark - Transcript throughput across N ai-core worker processes
+#
+# Each worker follows the transcript path of `uvicorn app.main:app --workers N`
+# with PUBSUB_BACKEND=unix: it appends the transcript to the meeting log,
+# analyzes it with FinancialAnalyzer and, when a chart is needed, logs the
+# analysis and publishes it on its meeting's `visualization:<meeting_id>`
+# channel. The broker runs in its own process, spawned by the first worker.
+# Each worker hosts one meeting and subscribes to that channel only, as a
+# worker does while it has sockets in the meeting, so a run finishes once
+# every worker has received its own broadcasts back through the broker.
+# WebSocket I/O is not included.
+#
+# Usage (from backend/ai-core):
+#   python -m benchmarks.pubsub_scaling --max-workers 8 --transcripts 5000
+#   python -m benchmarks.pubsub_scaling --meeting-log-dir data/meetings --meeting-id demo
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.messaging.pubsub import UnixSocketPubSub
+from app.models.financial_analyzer import FinancialAnalyzer
+from app.storage.meeting_log import MeetingLogStore
+
+SAMPLE_TRANSCRIPTS = [
+    "Can you show my portfolio performance for the last 6 months",
+    "Let's compare apple vs microsoft stocks",
+    "What were the historical performance returns for google over 2 years",
+    "How is the tech stocks sector performance looking",
+    "I'd like an investment overview with current holdings and returns",
+    "Thanks, that's everything for today",
+]
+
+async def load_corpus(log_dir: str, meeting_id: str) -> List[str]:
+    """Replay transcripts recorded by the meeting log as a benchmark corpus"""
+    store = MeetingLogStore(log_dir)
+    texts, offset = [], 0
+    while True:
+        records = await store.replay(meeting_id, offset=offset, limit=1000, kind="transcript")
+        if not records:
+            return texts
+        texts.extend(record.data["text"] for record in records)
+        offset = records[-1].offset + 1
+
+async def count_visualizations(corpus: List[str], count: int) -> int:
+    analyzer = FinancialAnalyzer()
+    results = [await analyzer.analyze_text(text) for text in corpus]
+    return sum(1 for i in range(count) if results[i % len(corpus)])
+
+async def run_worker(workdir: str, worker: int, corpus: List[str], count: int, expected: int, ready, start, done):
+    loop = asyncio.get_running_loop()
+    analyzer = FinancialAnalyzer()
+    await analyzer.initialize()
+    meeting_id = f"bench-{worker}"
+    meeting_log = MeetingLogStore(os.path.join(workdir, "meetings"))
+    await meeting_log.start()
+    received = 0
+    all_received = asyncio.Event()
+    if expected == 0:
+        all_received.set()
+
+    async def on_message(message):
+        nonlocal received
+        received += 1
+        if received >= expected:
+            all_received.set()
+
+    pubsub = UnixSocketPubSub(os.path.join(workdir, "pubsub.sock"), broker_idle_timeout=1.0)
+    pubsub.subscribe(f"visualization:{meeting_id}", on_message)
+    await pubsub.start()
+
+    # Barrier waits block, so keep them off the loop that may be hosting the broker
+    await loop.run_in_executor(None, ready.wait)
+    await loop.run_in_executor(None, start.wait)
+
+    for i in range(count):
+        text = corpus[i % len(corpus)]
+        meeting_log.append(meeting_id, "transcript", {"text": text, "timestamp": time.time()})
+        result = await analyzer.analyze_text(text)
+        if result and result.get("requires_visualization"):
+            meeting_log.append(meeting_id, "analysis", result)
+            await pubsub.publish(f"visualization:{meeting_id}", {
+                "type": "visualization_request",
+                "meeting_id": meeting_id,
+                "data": result
+            })
+
+    await all_received.wait()
+    await loop.run_in_executor(None, done.wait)
+    await pubsub.stop()
+    await meeting_log.stop()
+
+def worker_main(*args):
+    asyncio.run(run_worker(*args))
+
+def run(workers: int, corpus: List[str], transcripts: int) -> float:
+    """Process `transcripts` per worker; returns total transcripts per second"""
+    # Every worker runs the same transcripts, so each expects the same broadcasts
+    expected = asyncio.run(count_visualizations(corpus, transcripts))
+    workdir = tempfile.mkdtemp()
+    try:
+        return run_workers(workdir, workers, corpus, transcripts, expected)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def run_workers(workdir: str, workers: int, corpus: List[str], transcripts: int, expected: int) -> float:
+    ready = multiprocessing.Barrier(workers + 1)
+    start = multiprocessing.Barrier(workers + 1)
+    done = multiprocessing.Barrier(workers + 1)
+    processes = [
+        multiprocessing.Process(
+            target=worker_main,
+            args=(workdir, worker, corpus, transcripts, expected, ready, start, done)
+        )
+        for worker in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    ready.wait()
+    started = time.perf_counter()
+    start.wait()
+    done.wait()
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    return workers * transcripts / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Pub/sub scaling benchmark for ai-core workers")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--transcripts", type=int, default=5000, help="transcripts per worker")
+    parser.add_argument("--meeting-log-dir", help="replay transcripts from this meeting log")
+    parser.add_argument("--meeting-id", default="default")
+    args = parser.parse_args()
+
+    corpus = SAMPLE_TRANSCRIPTS
+    if args.meeting_log_dir:
+        corpus = asyncio.run(load_corpus(args.meeting_log_dir, args.meeting_id)) or SAMPLE_TRANSCRIPTS
+
+    baseline = None
+    print(f"{'workers':>8} {'transcripts/s':>14} {'speedup':>8}")
+    for workers in range(1, args.max_workers + 1):
+        throughput = run(workers, corpus, args.transcripts)
+        baseline = baseline or throughput
+        print(f"{workers:>8} {throughput:>14.0f} {throughput / baseline:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
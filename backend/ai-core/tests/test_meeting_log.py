@@ -0,0 +1,188 @@
+import asyncio
+import glob
+import multiprocessing
+import os
+
+import pytest
+
+from app.storage.meeting_log import MeetingLog, MeetingLogStore, validate_meeting_id
+
+def write_records(directory, count, segment_bytes=8 * 1024 * 1024):
+    log = MeetingLog(directory, segment_bytes)
+    log.open()
+    log.append_batch([("transcript", {"i": i, "text": f"line {i}"}) for i in range(count)], fsync=True)
+    log.close()
+
+def test_recovery_drops_every_index_entry_past_torn_tail(tmp_path):
+    directory = str(tmp_path / "m1")
+    write_records(directory, 27)
+    log_path = sorted(glob.glob(os.path.join(directory, "*.log")))[-1]
+    with open(log_path, "r+b") as f:
+        f.truncate(os.path.getsize(log_path) - 60)
+
+    log = MeetingLog(directory, 8 * 1024 * 1024)
+    log.open()
+    records = log.read(0, 100)
+    assert 0 < len(records) < 27
+    assert [r.data["i"] for r in records] == list(range(len(records)))
+    assert log.latest("transcript").data["i"] == len(records) - 1
+
+    # The repaired index must also survive another reopen
+    log.close()
+    reopened = MeetingLog(directory, 8 * 1024 * 1024)
+    reopened.open()
+    assert len(reopened.read(0, 100)) == len(records)
+
+def run_store(root, coro_fn, **kwargs):
+    async def main():
+        store = MeetingLogStore(root, flush_interval=0.001, **kwargs)
+        await store.start()
+        try:
+            return await coro_fn(store)
+        finally:
+            await store.stop()
+    return asyncio.run(main())
+
+async def append_and_stop(store, meeting_id, count):
+    for i in range(count):
+        store.append(meeting_id, "analysis" if i % 3 == 0 else "transcript", {"i": i})
+
+def test_replay_across_segment_rollover(tmp_path):
+    root = str(tmp_path)
+    run_store(root, lambda store: append_and_stop(store, "m1", 200), segment_bytes=1000)
+    assert len(glob.glob(os.path.join(root, "m1", "*.log"))) > 1
+
+    async def check(store):
+        records = await store.replay("m1", limit=1000)
+        assert [r.offset for r in records] == list(range(200))
+        assert [r.data["i"] for r in records] == list(range(200))
+    run_store(root, check, segment_bytes=1000)
+
+def test_replay_offset_since_kind_and_limit(tmp_path):
+    root = str(tmp_path)
+    run_store(root, lambda store: append_and_stop(store, "m1", 60), segment_bytes=500)
+
+    async def check(store):
+        page = await store.replay("m1", offset=10, limit=5)
+        assert [r.offset for r in page] == [10, 11, 12, 13, 14]
+
+        analysis = await store.replay("m1", kind="analysis", limit=4)
+        assert [r.offset for r in analysis] == [0, 3, 6, 9]
+        assert all(r.kind == "analysis" for r in analysis)
+        tail = await store.replay("m1", offset=50, kind="analysis", limit=100)
+        assert [r.offset for r in tail] == [51, 54, 57]
+
+        everything = await store.replay("m1", limit=1000)
+        since = await store.replay("m1", since=everything[42].timestamp, limit=1000)
+        assert since[0].timestamp >= everything[42].timestamp
+        assert since[0].offset <= 42 and since[-1].offset == 59
+
+        assert await store.replay("m1", offset=60) == []
+        assert await store.replay("missing") == []
+        assert (await store.latest("m1", "analysis")).offset == 57
+        with pytest.raises(ValueError):
+            await store.replay("m1", kind="bogus")
+    run_store(root, check, segment_bytes=500)
+
+def test_reopen_after_clean_stop_continues_offsets(tmp_path):
+    root = str(tmp_path)
+    run_store(root, lambda store: append_and_stop(store, "m1", 10))
+    run_store(root, lambda store: append_and_stop(store, "m1", 5))
+
+    async def check(store):
+        records = await store.replay("m1", limit=100)
+        assert [r.offset for r in records] == list(range(15))
+        assert [r.data["i"] for r in records] == list(range(10)) + list(range(5))
+        timestamps = [r.timestamp for r in records]
+        assert timestamps == sorted(timestamps)
+    run_store(root, check)
+
+def test_recovery_truncates_partial_record_at_tail(tmp_path):
+    directory = str(tmp_path / "m1")
+    write_records(directory, 5)
+    log_path = glob.glob(os.path.join(directory, "*.log"))[0]
+    size = os.path.getsize(log_path)
+    with open(log_path, "ab") as f:
+        f.write(b"\x40\x00\x00\x00garbage")
+
+    log = MeetingLog(directory, 8 * 1024 * 1024)
+    log.open()
+    assert os.path.getsize(log_path) == size
+    log.append_batch([("analysis", {"i": 5})], fsync=True)
+    assert [r.data["i"] for r in log.read(0, 100)] == list(range(6))
+    log.close()
+
+def test_recovery_reindexes_records_missing_from_index(tmp_path):
+    directory = str(tmp_path / "m1")
+    write_records(directory, 8)
+    index_path = glob.glob(os.path.join(directory, "*.index"))[0]
+    with open(index_path, "r+b") as f:
+        f.truncate(os.path.getsize(index_path) // 2 + 3)
+
+    log = MeetingLog(directory, 8 * 1024 * 1024)
+    log.open()
+    assert [r.data["i"] for r in log.read(0, 100)] == list(range(8))
+    log.close()
+
+def append_from_process(root, worker, count):
+    async def append(store):
+        for i in range(count):
+            store.append("shared", "transcript", {"worker": worker, "i": i})
+            if i % 25 == 0:
+                await asyncio.sleep(0.002)
+    run_store(root, append, segment_bytes=2000)
+
+def test_concurrent_processes_append_to_one_meeting(tmp_path):
+    root = str(tmp_path)
+    workers, count = 3, 300
+    processes = [
+        multiprocessing.Process(target=append_from_process, args=(root, worker, count))
+        for worker in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    async def check(store):
+        records = await store.replay("shared", limit=10000)
+        assert [r.offset for r in records] == list(range(workers * count))
+        for worker in range(workers):
+            assert [r.data["i"] for r in records if r.data["worker"] == worker] == list(range(count))
+        timestamps = [r.timestamp for r in records]
+        assert timestamps == sorted(timestamps)
+    run_store(root, check, segment_bytes=2000)
+
+@pytest.mark.parametrize("meeting_id", ["abc\n", "", "../etc", "a b", "x" * 65, "abc\r"])
+def test_validate_meeting_id_rejects_unsafe_ids(meeting_id):
+    with pytest.raises(ValueError):
+        validate_meeting_id(meeting_id)
+
+def test_validate_meeting_id_accepts_plain_ids():
+    assert validate_meeting_id("Meeting_42-b") == "Meeting_42-b"
+
+def open_fd_count():
+    return len(os.listdir("/proc/self/fd"))
+
+def test_many_meetings_do_not_hold_file_descriptors(tmp_path):
+    root = str(tmp_path)
+    before = open_fd_count()
+
+    async def append_to_many(store):
+        for meeting in range(40):
+            store.append(f"m{meeting}", "transcript", {"i": meeting})
+        await asyncio.sleep(0.2)
+        assert open_fd_count() - before < 10
+        assert len(store._logs) <= store.max_cached_logs
+        # Evicted meetings are reloaded from disk on demand
+        records = await store.replay("m0")
+        assert [r.data["i"] for r in records] == [0]
+    run_store(root, append_to_many, max_cached_logs=8)
+
+def test_append_drops_records_when_writer_is_behind(tmp_path):
+    async def overfill(store):
+        for i in range(store.max_pending + 5):
+            store.append("m1", "transcript", {"i": i})
+        assert store._queue.qsize() == store.max_pending
+    run_store(str(tmp_path), overfill, max_pending=20)
@@ -0,0 +1,343 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import stat
+
+import pytest
+
+from app.messaging.pubsub import (
+    InProcessPubSub,
+    UnixSocketBroker,
+    UnixSocketPubSub,
+    create_pubsub,
+    default_socket_path,
+)
+
+async def fake_broker(socket_path, frames_per_connection):
+    """Answer the subscribe handshake, then send canned frames on each connection"""
+    connections = []
+
+    async def handle(reader, writer):
+        frames = frames_per_connection[min(len(connections), len(frames_per_connection) - 1)]
+        connections.append(writer)
+        while (await reader.readline()).strip() != b'{"op":"sync"}':
+            pass
+        writer.write(b'{"op":"synced"}\n')
+        for frame in frames:
+            writer.write(frame)
+        await writer.drain()
+        await reader.read()
+
+    server = await asyncio.start_unix_server(handle, path=socket_path)
+    return server, connections
+
+async def wait_for(predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+def test_in_process_pubsub_delivers_to_subscribers():
+    async def main():
+        received = []
+        pubsub = InProcessPubSub()
+
+        async def handler(message):
+            received.append(message)
+        pubsub.subscribe("v", handler)
+        await pubsub.publish("v", {"n": 1})
+        await pubsub.publish("other", {"n": 2})
+        assert received == [{"n": 1}]
+    asyncio.run(main())
+
+def test_client_skips_malformed_frames(tmp_path):
+    async def main():
+        socket_path = str(tmp_path / "bus.sock")
+        server, _ = await fake_broker(socket_path, [[
+            b"not json\n",
+            b'{"channel":"v"}\n',
+            b"[1, 2]\n",
+            b'{"channel":"v","data":{"n":1}}\n',
+        ]])
+        received = []
+        client = UnixSocketPubSub(socket_path)
+
+        async def handler(message):
+            received.append(message)
+        client.subscribe("v", handler)
+        await client.start()
+        await wait_for(lambda: received)
+        assert received == [{"n": 1}]
+        assert client._connected
+        await client.stop()
+        server.close()
+    asyncio.run(main())
+
+def test_client_reconnects_after_oversized_frame(tmp_path):
+    async def main():
+        socket_path = str(tmp_path / "bus.sock")
+        oversized = b'{"channel":"v","data":"' + b"x" * 4096 + b'"}\n'
+        server, connections = await fake_broker(socket_path, [
+            [oversized],
+            [b'{"channel":"v","data":{"n":2}}\n'],
+        ])
+        received = []
+        client = UnixSocketPubSub(socket_path, reconnect_interval=0.01, max_frame=1024)
+
+        async def handler(message):
+            received.append(message)
+        client.subscribe("v", handler)
+        await client.start()
+        await wait_for(lambda: received)
+        assert received == [{"n": 2}]
+        assert len(connections) == 2
+        await client.stop()
+        server.close()
+    asyncio.run(main())
+
+def test_broker_skips_malformed_frames_and_keeps_client(tmp_path):
+    async def main():
+        socket_path = str(tmp_path / "bus.sock")
+        broker = UnixSocketBroker(socket_path)
+        await broker.start()
+        assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        for line in [
+            b"garbage\n",
+            b'{"op":"publish"}\n',
+            b'{"op":"subscribe","channel":["unhashable"]}\n',
+            b'{"op":"bogus"}\n',
+            b"42\n",
+            b'{"op":"subscribe","channel":"v"}\n',
+            b'{"op":"publish","channel":"v","data":{"n":1}}\n',
+        ]:
+            writer.write(line)
+        await writer.drain()
+        frame = json.loads(await asyncio.wait_for(reader.readline(), 5))
+        assert frame == {"channel": "v", "data": {"n": 1}}
+        writer.close()
+        await broker.stop()
+        assert not os.path.exists(socket_path)
+    asyncio.run(main())
+
+def test_broker_unsubscribe_stops_relaying_and_drops_empty_channel(tmp_path):
+    async def main():
+        socket_path = str(tmp_path / "bus.sock")
+        broker = UnixSocketBroker(socket_path)
+        await broker.start()
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        for line in [
+            b'{"op":"subscribe","channel":"visualization:a"}\n',
+            b'{"op":"subscribe","channel":"visualization:b"}\n',
+            b'{"op":"unsubscribe","channel":"visualization:a"}\n',
+            b'{"op":"unsubscribe","channel":"never-subscribed"}\n',
+            b'{"op":"publish","channel":"visualization:a","data":{"n":1}}\n',
+            b'{"op":"publish","channel":"visualization:b","data":{"n":2}}\n',
+            b'{"op":"sync"}\n',
+        ]:
+            writer.write(line)
+        await writer.drain()
+        frames = [json.loads(await asyncio.wait_for(reader.readline(), 5)) for _ in range(2)]
+        assert frames == [{"channel": "visualization:b", "data": {"n": 2}}, {"op": "synced"}]
+        assert set(broker._subscribers) == {"visualization:b"}
+        writer.close()
+        await broker.stop()
+    asyncio.run(main())
+
+def test_client_only_receives_channels_it_is_subscribed_to(tmp_path):
+    async def main():
+        socket_path = str(tmp_path / "bus.sock")
+        broker = UnixSocketBroker(socket_path)
+        await broker.start()
+        received = []
+        listener = UnixSocketPubSub(socket_path)
+        publisher = UnixSocketPubSub(socket_path)
+
+        async def handler(message):
+            received.append(message)
+        try:
+            await listener.start()
+            await publisher.start()
+            # Subscribing on a live connection reaches the broker without a reconnect
+            listener.subscribe("visualization:a", handler)
+            await wait_for(lambda: "visualization:a" in broker._subscribers)
+            await publisher.publish("visualization:b", {"n": 1})
+            await publisher.publish("visualization:a", {"n": 2})
+            await wait_for(lambda: received)
+            assert received == [{"n": 2}]
+
+            listener.unsubscribe("visualization:a", handler)
+            await wait_for(lambda: not broker._subscribers)
+            await publisher.publish("visualization:a", {"n": 3})
+            listener.subscribe("visualization:b", handler)
+            await wait_for(lambda: "visualization:b" in broker._subscribers)
+            await publisher.publish("visualization:b", {"n": 4})
+            await wait_for(lambda: len(received) == 2)
+            assert received == [{"n": 2}, {"n": 4}]
+        finally:
+            await listener.stop()
+            await publisher.stop()
+            await broker.stop()
+    asyncio.run(main())
+
+def test_unsubscribe_keeps_channel_until_last_handler_leaves():
+    async def main():
+        received = []
+        pubsub = InProcessPubSub()
+
+        async def first(message):
+            received.append(("first", message))
+
+        async def second(message):
+            received.append(("second", message))
+        pubsub.subscribe("v", first)
+        pubsub.subscribe("v", second)
+        pubsub.unsubscribe("v", first)
+        pubsub.unsubscribe("v", first)
+        await pubsub.publish("v", {"n": 1})
+        pubsub.unsubscribe("v", second)
+        await pubsub.publish("v", {"n": 2})
+        assert received == [("second", {"n": 1})]
+        assert "v" not in pubsub._handlers
+    asyncio.run(main())
+
+def test_default_socket_is_in_a_private_runtime_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    monkeypatch.delenv("PUBSUB_SOCKET", raising=False)
+    (tmp_path / "insightai").mkdir(mode=0o755)
+    os.chmod(tmp_path / "insightai", 0o755)
+    pubsub = create_pubsub("unix")
+    assert pubsub.socket_path == str(tmp_path / "insightai" / "pubsub.sock")
+    assert stat.S_IMODE(os.stat(tmp_path / "insightai").st_mode) == 0o700
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="needs root to create files owned by another user")
+def test_refuses_directories_and_sockets_owned_by_another_user(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    (tmp_path / "insightai").mkdir()
+    os.chown(tmp_path / "insightai", 65534, 65534)
+    with pytest.raises(PermissionError):
+        default_socket_path()
+
+    async def main():
+        socket_path = str(tmp_path / "bus.sock")
+        broker = UnixSocketBroker(socket_path)
+        await broker.start()
+        assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+        os.chown(socket_path, 65534, 65534)
+        with pytest.raises(PermissionError):
+            await UnixSocketPubSub(socket_path).start()
+        await broker.stop()
+    asyncio.run(main())
+
+def broker_pid(socket_path):
+    with open(socket_path + ".lock") as f:
+        content = f.read()
+    return int(content) if content else None
+
+def kill_broker(socket_path):
+    pid = broker_pid(socket_path)
+    if pid:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    return pid
+
+def test_spawned_broker_relays_between_clients_and_fails_over(tmp_path):
+    async def main():
+        socket_path = str(tmp_path / "bus.sock")
+        received = {"a": [], "b": []}
+        clients = {}
+        for name in received:
+            clients[name] = UnixSocketPubSub(socket_path, reconnect_interval=0.05, broker_idle_timeout=1.0)
+
+            async def handler(message, name=name):
+                received[name].append(message)
+            clients[name].subscribe("v", handler)
+        try:
+            await asyncio.gather(*(client.start() for client in clients.values()))
+            first_pid = broker_pid(socket_path)
+            assert first_pid and first_pid != os.getpid()
+
+            await clients["a"].publish("v", {"n": 1})
+            await wait_for(lambda: all(received.values()))
+
+            kill_broker(socket_path)
+            await wait_for(lambda: broker_pid(socket_path) not in (None, first_pid)
+                           and all(client._connected for client in clients.values()))
+            await clients["b"].publish("v", {"n": 2})
+            await wait_for(lambda: all(len(messages) == 2 for messages in received.values()))
+            assert received["a"] == received["b"] == [{"n": 1}, {"n": 2}]
+        finally:
+            for client in clients.values():
+                await client.stop()
+            kill_broker(socket_path)
+    asyncio.run(main())
+
+def test_publish_right_after_broker_dies_delivers_locally(tmp_path):
+    async def main():
+        socket_path = str(tmp_path / "bus.sock")
+        received = []
+        client = UnixSocketPubSub(socket_path, reconnect_interval=0.05, broker_idle_timeout=1.0)
+
+        async def handler(message):
+            received.append(message)
+        client.subscribe("v", handler)
+        try:
+            await client.start()
+            first_pid = kill_broker(socket_path)
+            # Block without yielding, so the reader loop has not seen the EOF yet
+            client._broker_process.wait(timeout=5)
+            for n in range(3):
+                await client.publish("v", {"n": n})
+            assert received == [{"n": 0}, {"n": 1}, {"n": 2}]
+
+            await wait_for(lambda: broker_pid(socket_path) not in (None, first_pid) and client._connected)
+            await client.publish("v", {"n": 3})
+            await wait_for(lambda: len(received) == 4)
+            assert received[-1] == {"n": 3}
+        finally:
+            await client.stop()
+            kill_broker(socket_path)
+    asyncio.run(main())
+
+def publish_from_process(socket_path, worker, count, expected, ready, results):
+    async def main():
+        received = []
+        client = UnixSocketPubSub(socket_path, reconnect_interval=0.05, broker_idle_timeout=1.0)
+
+        async def handler(message):
+            received.append(message)
+        client.subscribe("v", handler)
+        await client.start()
+        await asyncio.get_running_loop().run_in_executor(None, ready.wait)
+        for i in range(count):
+            await client.publish("v", {"worker": worker, "i": i})
+        await wait_for(lambda: len(received) >= expected, timeout=20)
+        await client.stop()
+        results.put((worker, len(received)))
+    asyncio.run(main())
+
+def test_broadcasts_reach_every_worker_process(tmp_path):
+    socket_path = str(tmp_path / "bus.sock")
+    workers, count = 3, 100
+    ready = multiprocessing.Barrier(workers)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=publish_from_process,
+            args=(socket_path, worker, count, workers * count, ready, results)
+        )
+        for worker in range(workers)
+    ]
+    try:
+        for process in processes:
+            process.start()
+        outcome = sorted(results.get(timeout=30) for _ in processes)
+        assert outcome == [(worker, workers * count) for worker in range(workers)]
+    finally:
+        for process in processes:
+            process.join(timeout=5)
+        kill_broker(socket_path)